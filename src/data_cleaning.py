@@ -5,9 +5,10 @@ Task 2: Clean and preprocess raw dataset for analysis
 
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from numba import njit, prange
 import logging
-import json
+import orjson
+from typing import Optional, Sequence, Tuple
 
 # Set up logging
 logging.basicConfig(
@@ -16,92 +17,134 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Copy-on-write lets the cleaning steps below share data with their input
+# and only materialise the columns they actually modify
+pd.set_option("mode.copy_on_write", True)
+
+def _classify(df: pd.DataFrame) -> Tuple[tuple, tuple]:
+    """Split column names into (numerical, categorical) groups in one dtype pass"""
+    num_cols = tuple(df.select_dtypes(include=[np.number]).columns)
+    cat_cols = tuple(df.select_dtypes(include=['object']).columns)
+    return num_cols, cat_cols
+
+@njit(parallel=True, cache=True)
+def _iqr_outlier_mask(arr, lower, upper):
+    """Flag values outside [lower, upper] column-wise, scanning columns in parallel"""
+    out = np.empty(arr.shape, dtype=np.bool_)
+    for j in prange(arr.shape[1]):
+        col = arr[:, j]
+        out[:, j] = (col < lower[j]) | (col > upper[j])
+    return out
+
 class DataCleaner:
     """Data cleaning and preprocessing class for book data"""
     
-    def __init__(self):
-        self.scaler = StandardScaler()
-        self.label_encoder = LabelEncoder()
-        
     def load_data(self, csv_path: str) -> pd.DataFrame:
         """Load data from CSV file"""
         try:
-            df = pd.read_csv(csv_path)
+            # The pyarrow engine parses in parallel; price is known up front so its
+            # type is fixed rather than inferred. Text columns stay object dtype,
+            # which the rest of the pipeline selects on.
+            df = pd.read_csv(csv_path, engine='pyarrow', dtype={'price': 'float32'})
             logger.info(f"Loaded data from {csv_path}: {df.shape[0]} rows, {df.shape[1]} columns")
             return df
         except Exception as e:
             logger.error(f"Error loading data: {e}")
             return None
     
-    def handle_missing_values(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Handle missing values in the dataset"""
+    def handle_missing_values(self, df: pd.DataFrame, num_cols: Optional[Sequence[str]] = None,
+                              cat_cols: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Handle missing values in the dataset
+        
+        num_cols/cat_cols are the precomputed column groups from _classify;
+        they are derived from the dtypes when omitted, and names not present
+        in df are ignored.
+        """
         logger.info("=== HANDLING MISSING VALUES ===")
         
-        df_clean = df.copy()
+        df_clean = df
         
         # Check for missing values
-        missing_before = df_clean.isnull().sum().sum()
+        missing_counts = df_clean.isnull().sum()
+        missing_before = missing_counts.sum()
         logger.info(f"Total missing values before handling: {missing_before}")
         
+        # Collect every fill value first, then apply them in a single fillna call
+        fill_values = {}
+        
         # Handle specific columns
         if 'description' in df_clean.columns:
-            df_clean['description'] = df_clean['description'].fillna('No description available')
-            logger.info("Filled missing descriptions")
-        
-        if 'rating' in df_clean.columns:
-            mode_rating = df_clean['rating'].mode()[0] if not df_clean['rating'].mode().empty else 'No rating'
-            df_clean['rating'] = df_clean['rating'].fillna(mode_rating)
-            logger.info(f"Filled missing ratings with mode: {mode_rating}")
+            fill_values['description'] = 'No description available'
         
         # For numerical columns, fill with median
-        numerical_cols = df_clean.select_dtypes(include=[np.number]).columns
+        if num_cols is None or cat_cols is None:
+            classified_num, classified_cat = _classify(df_clean)
+            num_cols = classified_num if num_cols is None else num_cols
+            cat_cols = classified_cat if cat_cols is None else cat_cols
+        numerical_cols = [col for col in num_cols
+                          if col in df_clean.columns and col != 'rating' and missing_counts[col] > 0]
+        medians = df_clean[numerical_cols].median()
         for col in numerical_cols:
-            if df_clean[col].isnull().sum() > 0:
-                median_val = df_clean[col].median()
-                df_clean[col] = df_clean[col].fillna(median_val)
-                logger.info(f"Filled missing values in {col} with median: {median_val}")
-        
-        # For categorical columns, fill with mode
-        categorical_cols = df_clean.select_dtypes(include=['object']).columns
+            fill_values[col] = medians[col]
+            logger.info(f"Filled missing values in {col} with median: {medians[col]}")
+        
+        # For categorical columns (and rating), fill with mode
+        categorical_cols = [col for col in cat_cols
+                            if col in df_clean.columns and col not in ('description', 'rating')
+                            and missing_counts[col] > 0]
+        if 'rating' in df_clean.columns and missing_counts['rating'] > 0:
+            categorical_cols.append('rating')
         for col in categorical_cols:
-            if col != 'description' and df_clean[col].isnull().sum() > 0:
-                mode_val = df_clean[col].mode()[0] if not df_clean[col].mode().empty else 'Unknown'
-                df_clean[col] = df_clean[col].fillna(mode_val)
-                logger.info(f"Filled missing values in {col} with mode: {mode_val}")
+            # A single hash-count pass is cheaper than mode(), which sorts the unique values
+            counts = df_clean[col].value_counts(dropna=True)
+            default = 'No rating' if col == 'rating' else 'Unknown'
+            mode_val = counts.idxmax() if not counts.empty else default
+            fill_values[col] = mode_val
+            logger.info(f"Filled missing values in {col} with mode: {mode_val}")
+        
+        df_clean = df_clean.fillna(fill_values)
+        if 'description' in fill_values:
+            logger.info("Filled missing descriptions")
         
         missing_after = df_clean.isnull().sum().sum()
         logger.info(f"Total missing values after handling: {missing_after}")
         
         return df_clean
     
-    def detect_outliers(self, df: pd.DataFrame) -> dict:
+    def detect_outliers(self, df: pd.DataFrame, num_cols: Optional[Sequence[str]] = None) -> dict:
         """Detect outliers in numerical columns using IQR method"""
         logger.info("=== DETECTING OUTLIERS ===")
         
         outliers = {}
-        numerical_cols = df.select_dtypes(include=[np.number]).columns
+        if num_cols is None:
+            num_cols, _ = _classify(df)
+        num = df[[col for col in num_cols if col in df.columns]]
         
-        for col in numerical_cols:
-            Q1 = df[col].quantile(0.25)
-            Q3 = df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            
-            outlier_mask = (df[col] < lower_bound) | (df[col] > upper_bound)
-            outlier_count = outlier_mask.sum()
-            
+        arr = num.to_numpy(dtype=np.float64)
+        
+        # Compute the IQR bounds for every numerical column at once
+        Q1, Q3 = np.nanquantile(arr, [0.25, 0.75], axis=0)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - 1.5 * IQR
+        upper_bound = Q3 + 1.5 * IQR
+        
+        # Boolean outlier matrix from the JIT-compiled kernel
+        mask_values = _iqr_outlier_mask(arr, lower_bound, upper_bound)
+        outlier_counts = mask_values.sum(axis=0)
+        
+        for j, col in enumerate(num.columns):
+            outlier_count = int(outlier_counts[j])
             if outlier_count > 0:
                 outliers[col] = {
                     'count': outlier_count,
                     'percentage': (outlier_count / len(df)) * 100,
-                    'indices': df[outlier_mask].index.tolist()
+                    'indices': num.index[mask_values[:, j]].tolist()
                 }
                 logger.info(f"{col}: {outlier_count} outliers ({outlier_count/len(df)*100:.2f}%)")
         
         # Save outliers info
-        with open('data/preprocessed/outliers_info.json', 'w') as f:
-            json.dump(outliers, f, indent=4)
+        with open('data/preprocessed/outliers_info.json', 'wb') as f:
+            f.write(orjson.dumps(outliers, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
         
         return outliers
     
@@ -109,14 +152,15 @@ class DataCleaner:
         """Remove outliers from the dataset"""
         logger.info("=== REMOVING OUTLIERS ===")
         
-        df_clean = df.copy()
-        indices_to_remove = set()
+        df_clean = df
         
+        # Boolean keep-mask over all rows; outlier labels are matched in one pass
+        keep_mask = np.ones(len(df_clean), dtype=bool)
         for col, info in outliers.items():
-            indices_to_remove.update(info['indices'])
+            keep_mask &= ~df_clean.index.isin(info['indices'])
         
         before_count = len(df_clean)
-        df_clean = df_clean.drop(list(indices_to_remove))
+        df_clean = df_clean.iloc[keep_mask]
         after_count = len(df_clean)
         
         logger.info(f"Removed {before_count - after_count} rows containing outliers")
@@ -124,49 +168,70 @@ class DataCleaner:
         
         return df_clean
     
-    def encode_categorical_variables(self, df: pd.DataFrame) -> pd.DataFrame:
+    def encode_categorical_variables(self, df: pd.DataFrame,
+                                     cat_cols: Optional[Sequence[str]] = None) -> pd.DataFrame:
         """Convert categorical variables into numerical format"""
         logger.info("=== ENCODING CATEGORICAL VARIABLES ===")
         
-        df_encoded = df.copy()
+        df_encoded = df.copy(deep=False)
         
         # Label encoding for ordinal variables
         if 'rating' in df_encoded.columns:
-            rating_mapping = {
-                'One': 1, 'Two': 2, 'Three': 3, 'Four': 4, 'Five': 5,
-                'No rating': 0
-            }
-            df_encoded['rating_encoded'] = df_encoded['rating'].map(rating_mapping).fillna(0)
+            # Category position doubles as the encoded value: 'No rating' -> 0 ... 'Five' -> 5
+            rating_categories = ['No rating', 'One', 'Two', 'Three', 'Four', 'Five']
+            ratings = pd.Categorical(df_encoded['rating'], categories=rating_categories, ordered=True)
+            # Unknown or missing ratings get code -1; treat them as 'No rating'
+            df_encoded['rating_encoded'] = np.maximum(ratings.codes, 0).astype(np.int8)
             logger.info("Encoded rating column")
         
         # One-hot encoding for nominal variables
-        categorical_cols = df_encoded.select_dtypes(include=['object']).columns
-        categorical_cols = [col for col in categorical_cols if col not in ['title', 'description', 'url', 'rating']]
+        if cat_cols is None:
+            _, cat_cols = _classify(df_encoded)
+        categorical_cols = [col for col in cat_cols
+                            if col in df_encoded.columns and col not in ['title', 'description', 'url', 'rating']]
         
+        cols_to_encode = []
         for col in categorical_cols:
-            if df_encoded[col].nunique() <= 10:  # Only encode if reasonable number of categories
-                dummies = pd.get_dummies(df_encoded[col], prefix=col, drop_first=True)
-                df_encoded = pd.concat([df_encoded, dummies], axis=1)
-                logger.info(f"One-hot encoded {col} ({df_encoded[col].nunique()} categories)")
+            n_categories = df_encoded[col].nunique()
+            if n_categories <= 10:  # Only encode if reasonable number of categories
+                cols_to_encode.append(col)
+                logger.info(f"One-hot encoded {col} ({n_categories} categories)")
+        
+        # Build all dummy columns in a single pass and attach them at once,
+        # keeping the original columns alongside the dummies
+        if cols_to_encode:
+            dummies = pd.get_dummies(df_encoded[cols_to_encode], drop_first=True, dtype=np.int8)
+            df_encoded = pd.concat([df_encoded, dummies], axis=1)
         
         return df_encoded
     
-    def normalize_numerical_data(self, df: pd.DataFrame) -> pd.DataFrame:
+    def normalize_numerical_data(self, df: pd.DataFrame,
+                                 num_cols: Optional[Sequence[str]] = None) -> pd.DataFrame:
         """Normalize or standardize numerical data"""
         logger.info("=== NORMALIZING NUMERICAL DATA ===")
         
-        df_normalized = df.copy()
-        numerical_cols = df.select_dtypes(include=[np.number]).columns
+        df_normalized = df.copy(deep=False)
+        if num_cols is None:
+            num_cols, _ = _classify(df)
         
         # Remove columns that were just created from encoding
-        numerical_cols = [col for col in numerical_cols if not col.endswith('_encoded') and not any(x in col for x in ['_', 'price'])]
-        
-        for col in numerical_cols:
-            if col in df_normalized.columns and df_normalized[col].nunique() > 1:
-                # Standard scaling (z-score normalization)
-                df_normalized[col + '_standardized'] = (df_normalized[col] - df_normalized[col].mean()) / df_normalized[col].std()
-                # Min-max scaling
-                df_normalized[col + '_normalized'] = (df_normalized[col] - df_normalized[col].min()) / (df_normalized[col].max() - df_normalized[col].min())
+        numerical_cols = [col for col in num_cols if col in df_normalized.columns and not col.endswith('_encoded') and not any(x in col for x in ['_', 'price'])]
+        
+        numerical_cols = [col for col in numerical_cols if df_normalized[col].nunique() > 1]
+        
+        if numerical_cols:
+            # Gather all column statistics in one aggregation
+            stats = df_normalized[numerical_cols].agg(['mean', 'std', 'min', 'max'])
+            arr = df_normalized[numerical_cols].to_numpy(dtype=np.float64)
+            col_min = stats.loc['min'].to_numpy()
+            # Standard scaling (z-score normalization)
+            std_out = (arr - stats.loc['mean'].to_numpy()) / stats.loc['std'].to_numpy()
+            # Min-max scaling
+            mm_out = (arr - col_min) / (stats.loc['max'].to_numpy() - col_min)
+            
+            df_normalized[[col + '_standardized' for col in numerical_cols]] = std_out
+            df_normalized[[col + '_normalized' for col in numerical_cols]] = mm_out
+            for col in numerical_cols:
                 logger.info(f"Normalized {col}")
         
         return df_normalized
@@ -177,7 +242,11 @@ class DataCleaner:
             if filename.endswith('.csv'):
                 df.to_csv(filename, index=False)
             elif filename.endswith('.json'):
-                df.to_json(filename, orient='records', indent=4)
+                records = df.to_dict(orient='records')
+                with open(filename, 'wb') as f:
+                    f.write(orjson.dumps(records, option=orjson.OPT_SERIALIZE_NUMPY))
+            elif filename.endswith('.parquet'):
+                df.to_parquet(filename, engine='pyarrow', compression='snappy', index=False)
             
             logger.info(f"Cleaned data saved to {filename}")
         except Exception as e:
@@ -192,24 +261,27 @@ def main():
     df = cleaner.load_data('data/raw/scraped_books.csv')
     
     if df is not None:
+        # Classify columns once and reuse the groups across every step
+        num_cols, cat_cols = _classify(df)
+        
         # Handle missing values
-        df_clean = cleaner.handle_missing_values(df)
+        df_clean = cleaner.handle_missing_values(df, num_cols, cat_cols)
         
         # Detect outliers
-        outliers = cleaner.detect_outliers(df_clean)
+        outliers = cleaner.detect_outliers(df_clean, num_cols)
         
         # Remove outliers
         df_clean = cleaner.remove_outliers(df_clean, outliers)
         
         # Encode categorical variables
-        df_encoded = cleaner.encode_categorical_variables(df_clean)
+        df_encoded = cleaner.encode_categorical_variables(df_clean, cat_cols)
         
-        # Normalize numerical data
+        # Normalize numerical data (reclassified, as encoding added numeric columns)
         df_normalized = cleaner.normalize_numerical_data(df_encoded)
         
         # Save cleaned data
+        cleaner.save_cleaned_data(df_normalized, 'data/preprocessed/cleaned_books.parquet')
         cleaner.save_cleaned_data(df_normalized, 'data/preprocessed/cleaned_books.csv')
-        cleaner.save_cleaned_data(df_normalized, 'data/preprocessed/cleaned_books.json')
         
         logger.info("Data cleaning completed successfully!")
     else:
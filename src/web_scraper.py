@@ -2,12 +2,14 @@
 Target Website: books.toscrape.com (a practice website for web scraping)
 """
 
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import aiohttp
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+from selectolax.parser import HTMLParser
 import pandas as pd
-import time
+import random
 import logging
-from typing import List, Dict
+from typing import List, Dict, TextIO
 import re
 
 # Set up logging
@@ -17,60 +19,101 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Star rating names used as the second class on the p.star-rating element
+STAR_RATINGS = frozenset({'One', 'Two', 'Three', 'Four', 'Five'})
+
+# Output columns, in order; the table headers follow the product information table
+BOOK_FIELDS = [
+    'title', 'price', 'availability', 'rating', 'description', 'upc', 'product_type',
+    'price_(excl._tax)', 'price_(incl._tax)', 'tax', 'number_of_reviews', 'url'
+]
+
+# Everything that is not part of the numeric amount in a price string (e.g. the '£' sign)
+PRICE_STRIP_RE = re.compile(r'[^\d.]')
+
 class BookScraper:
     """A web scraper for extracting book information from books.toscrape.com"""
     
-    def __init__(self, base_url: str = "https://books.toscrape.com"):
+    def __init__(self, base_url: str = "https://books.toscrape.com", max_concurrency: int = 16,
+                 cache_name: str = 'book_cache', cache_expire_after: int = 86400,
+                 max_retries: int = 3, backoff_factor: float = 0.3, request_timeout: float = 30):
         self.base_url = base_url
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        }
+        self.max_concurrency = max_concurrency
+        # Connection errors are retried with exponential backoff
+        if max_retries < 0:
+            raise ValueError(f"max_retries must be >= 0, got {max_retries}")
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # Per-request time limit, so a stalled connection fails and is retried
+        # instead of holding a semaphore slot for aiohttp's 300 s default
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout)
+        # Responses are cached in a local SQLite file so repeat runs skip the network
+        self.cache_name = cache_name
+        self.cache_expire_after = cache_expire_after
+        # The aiohttp session must be created inside a running event loop,
+        # so it is opened in scrape_all_books
+        self.session = None
+        self.semaphore = None
         
-    def get_page_content(self, url: str) -> BeautifulSoup:
-        """Fetch and parse webpage content"""
-        try:
-            response = self.session.get(url)
-            response.raise_for_status()  # Raise exception for bad status codes
-            return BeautifulSoup(response.content, 'html.parser')
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching {url}: {e}")
-            return None
+    async def _get_page_content(self, url: str) -> HTMLParser:
+        """Fetch and parse webpage content (requires the session opened by scrape_all_books)"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.session.get(url) as response:
+                    response.raise_for_status()  # Raise exception for bad status codes
+                    content = await response.read()
+                return HTMLParser(content)
+            except aiohttp.ClientResponseError as e:
+                # Bad status codes are not retried
+                logger.error(f"Error fetching {url}: {e}")
+                return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Error fetching {url}: {e}")
+                    return None
+                logger.warning(f"Retrying {url} after error: {e}")
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+        return None
     
-    def extract_book_data(self, book_url: str) -> Dict:
-        """Extract detailed information from a book page"""
-        soup = self.get_page_content(book_url)
-        if not soup:
+    async def _extract_book_data(self, book_url: str) -> Dict:
+        """Extract detailed information from a book page (requires an open scrape_all_books)"""
+        async with self.semaphore:
+            tree = await self._get_page_content(book_url)
+            # Be respectful - add a small jitter between requests
+            await asyncio.sleep(random.uniform(0, 0.2))
+        if not tree:
             return None
             
         book_info = {}
         
         try:
             # Extract book title
-            book_info['title'] = soup.find('h1').text
+            book_info['title'] = tree.css_first('h1').text()
             
-            # Extract price
-            price = soup.find('p', class_='price_color').text
-            book_info['price'] = float(price.replace('£', ''))
+            # Extract price (raw string, converted in bulk by to_dataframe)
+            book_info['price'] = tree.css_first('p.price_color').text()
             
             # Extract availability
-            availability = soup.find('p', class_='instock availability').text
+            availability = tree.css_first('p.instock.availability').text()
             book_info['availability'] = availability.strip()
             
             # Extract rating
-            rating_classes = soup.find('p', class_='star-rating')['class']
-            book_info['rating'] = rating_classes[1] if len(rating_classes) > 1 else 'No rating'
+            rating_class = tree.css_first('p.star-rating').attributes['class'].split()[-1]
+            book_info['rating'] = rating_class if rating_class in STAR_RATINGS else 'No rating'
             
             # Extract product description
-            description = soup.find('meta', attrs={'name': 'description'})['content']
+            description = tree.css_first('meta[name="description"]').attributes['content']
             book_info['description'] = description.strip()
             
             # Extract product information from table
-            table = soup.find('table', class_='table table-striped')
-            for row in table.find_all('tr'):
-                header = row.find('th').text
-                value = row.find('td').text
-                book_info[header.lower().replace(' ', '_')] = value.strip()
+            headers = [node.text(strip=True) for node in tree.css('table.table-striped th')]
+            values = [node.text(strip=True) for node in tree.css('table.table-striped td')]
+            book_info.update({
+                header.lower().replace(' ', '_'): value for header, value in zip(headers, values)
+            })
                 
             book_info['url'] = book_url
             logger.info(f"Successfully scraped: {book_info['title']}")
@@ -81,75 +124,129 @@ class BookScraper:
             
         return book_info
     
-    def get_all_books_from_page(self, page_url: str) -> List[Dict]:
-        """Get all books from a catalog page"""
-        soup = self.get_page_content(page_url)
-        if not soup:
-            return []
-            
-        books = []
-        book_elements = soup.find_all('article', class_='product_pod')
+    def get_book_urls(self, tree: HTMLParser) -> List[str]:
+        """Collect the absolute book URLs listed on a parsed catalog page"""
+        book_urls = []
+        book_links = tree.css('article.product_pod h3 a')
         
-        for book in book_elements:
-            relative_url = book.find('h3').find('a')['href']
+        for link in book_links:
+            relative_url = link.attributes['href']
             # Handle relative URLs
             if relative_url.startswith('catalogue/'):
                 full_url = f"{self.base_url}/catalogue/{relative_url.replace('../../', '')}"
             else:
                 full_url = f"{self.base_url}/catalogue/{relative_url}"
-                
-            book_data = self.extract_book_data(full_url)
-            if book_data:
-                books.append(book_data)
-            # Be respectful - add a small delay between requests
-            time.sleep(0.5)
+            book_urls.append(full_url)
             
-        return books
+        return book_urls
     
-    def scrape_all_books(self, max_pages: int = None) -> List[Dict]:
-        """Scrape books from all pages with pagination handling"""
-        all_books = []
-        page_num = 1
-        next_page_url = f"{self.base_url}/catalogue/page-{page_num}.html"
+    async def scrape_all_books(self, csv_filename: str, jsonl_filename: str,
+                               max_pages: int = None, flush_every: int = 50) -> int:
+        """Scrape books from all pages and stream them to CSV and JSON Lines files
         
-        while next_page_url:
-            if max_pages and page_num > max_pages:
-                break
-                
-            logger.info(f"Scraping page {page_num}: {next_page_url}")
-            soup = self.get_page_content(next_page_url)
-            
-            if not soup:
-                break
-                
-            # Extract books from current page
-            page_books = self.get_all_books_from_page(next_page_url)
-            all_books.extend(page_books)
+        Book pages are fetched and written in catalog order, ``flush_every`` at a
+        time with one batch of lookahead, so at most two batches are held in memory
+        and partial progress survives a crash.
+        Returns the number of books written.
+        """
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        cache = SQLiteBackend(self.cache_name, expire_after=self.cache_expire_after)
+        written = 0
+        try:
+            async with CachedSession(cache=cache, headers=self.headers, timeout=self.timeout) as session:
+                self.session = session
             
-            # Check for next page
-            next_button = soup.find('li', class_='next')
-            if next_button:
-                page_num += 1
+                # Walk the catalog pages first (cheap) and collect every book URL
+                book_urls = []
+                page_num = 1
                 next_page_url = f"{self.base_url}/catalogue/page-{page_num}.html"
-            else:
-                next_page_url = None
+            
+                while next_page_url:
+                    if max_pages and page_num > max_pages:
+                        break
+                    
+                    logger.info(f"Scraping page {page_num}: {next_page_url}")
+                    tree = await self._get_page_content(next_page_url)
+                
+                    if not tree:
+                        break
+                    
+                    book_urls.extend(self.get_book_urls(tree))
                 
-            # Be respectful - add a delay between pages
-            time.sleep(1)
+                    # Check for next page
+                    next_button = tree.css_first('li.next')
+                    if next_button:
+                        page_num += 1
+                        next_page_url = f"{self.base_url}/catalogue/page-{page_num}.html"
+                    else:
+                        next_page_url = None
             
-        return all_books
+                # Fetch book pages in fixed-size slices, each slice concurrently
+                # (bounded by the semaphore), and append them in catalog order. The
+                # next slice is scheduled before the current one is awaited, so the
+                # semaphore stays busy while a slice waits on its slowest page.
+                logger.info(f"Found {len(book_urls)} books, fetching details...")
+                slices = [book_urls[start:start + flush_every] for start in range(0, len(book_urls), flush_every)]
+                header_written = False
+                with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file, \
+                        open(jsonl_filename, 'w', encoding='utf-8') as jsonl_file:
+                    current, upcoming = self._schedule_slice(slices, 0), []
+                    try:
+                        for k in range(len(slices)):
+                            upcoming = self._schedule_slice(slices, k + 1)
+                            results = await asyncio.gather(*current)
+                            batch = [book for book in results if book]
+                            if batch:
+                                written += self.append_records(batch, csv_file, jsonl_file,
+                                                               write_header=not header_written)
+                                header_written = True
+                            current = upcoming
+                    except BaseException:
+                        for task in current + upcoming:
+                            task.cancel()
+                        raise
+                    if not header_written:
+                        self.append_records([], csv_file, jsonl_file, write_header=True)
+        finally:
+            self.session = None
+            self.semaphore = None
+        logger.info(f"Data saved to {csv_filename} and {jsonl_filename} with {written} records")
+        return written
+    
+    def _schedule_slice(self, slices: List[List[str]], k: int) -> List[asyncio.Task]:
+        """Start fetching the k-th slice of book URLs (no tasks past the last slice)"""
+        if k >= len(slices):
+            return []
+        return [asyncio.ensure_future(self._extract_book_data(url)) for url in slices[k]]
+    
+    def to_dataframe(self, data: List[Dict]) -> pd.DataFrame:
+        """Build a DataFrame from scraped records, parsing prices in one pass
+        
+        Records whose price cannot be parsed are dropped, as a failed parse
+        inside _extract_book_data would have done.
+        """
+        df = pd.DataFrame(data, columns=BOOK_FIELDS)
+        prices = pd.to_numeric(df['price'].str.replace(PRICE_STRIP_RE, '', regex=True), errors='coerce')
+        bad_price = prices.isna()
+        if bad_price.any():
+            for url in df.loc[bad_price, 'url']:
+                logger.error(f"Error parsing price from {url}")
+            df = df[~bad_price]
+            prices = prices[~bad_price]
+        return df.assign(price=prices.astype('float64'))
     
-    def save_to_csv(self, data: List[Dict], filename: str = 'scraped_books.csv'):
-        """Save scraped data to CSV file"""
-        df = pd.DataFrame(data)
-        df.to_csv(filename, index=False)
-        logger.info(f"Data saved to {filename} with {len(data)} records")
+    def append_records(self, data: List[Dict], csv_file: TextIO, jsonl_file: TextIO,
+                       write_header: bool = False) -> int:
+        """Append a batch of scraped records to open CSV and JSON Lines files
         
-    def save_to_json(self, data: List[Dict], filename: str = 'scraped_books.json'):
-        """Save scraped data to JSON file"""
-        df = pd.DataFrame(data)
-        df.to_json(filename, orient='records', indent=4)
-        logger.info(f"Data saved to {filename} with {len(data)} records")
+        Returns the number of records written.
+        """
+        df = self.to_dataframe(data)
+        df.to_csv(csv_file, header=write_header, index=False)
+        df.to_json(jsonl_file, orient='records', lines=True)
+        csv_file.flush()
+        jsonl_file.flush()
+        return len(df)
 
 def main():
     """Main function to run the web scraper"""
@@ -157,13 +254,12 @@ def main():
     
     # Scrape data (limit to 2 pages for demonstration)
     logger.info("Starting web scraping process...")
-    books_data = scraper.scrape_all_books(max_pages=50)
+    total_books = asyncio.run(scraper.scrape_all_books(
+        'data/raw/scraped_books.csv', 'data/raw/scraped_books.jsonl', max_pages=50
+    ))
     
-    if books_data:
-        # Save data in multiple formats
-        scraper.save_to_csv(books_data, 'data/raw/scraped_books.csv')
-        scraper.save_to_json(books_data, 'data/raw/scraped_books.json')
-        logger.info(f"Scraping completed. Total books: {len(books_data)}")
+    if total_books:
+        logger.info(f"Scraping completed. Total books: {total_books}")
     else:
         logger.error("No data was scraped.")
 